@@ -6,6 +6,7 @@
 
 import os
 import requests
+import cv2
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 
@@ -15,11 +16,14 @@ def create_sample_anime_faces():
     input_dir = "input"
     os.makedirs(input_dir, exist_ok=True)
     
-    # シンプルなアニメ風顔画像を生成
-    def create_anime_face(size=(200, 200), face_color=(255, 220, 177), 
-                         hair_color=(139, 69, 19), eye_color=(0, 100, 200)):
-        """シンプルなアニメ風顔を描画"""
-        img = Image.new('RGB', size, (255, 255, 255))
+    # 領域ごとのラベル値
+    BACKGROUND, HAIR, FACE, FACE_OUTLINE = 0, 1, 2, 3
+    EYE_WHITE, EYE_OUTLINE, IRIS, PUPIL, NOSE, MOUTH = 4, 5, 6, 7, 8, 9
+    
+    # シンプルなアニメ風顔の形状をラベルマップとして一度だけ描画
+    def create_face_labels(size=(200, 200)):
+        """各画素に領域ラベルを持つアニメ風顔のラベルマップを描画"""
+        img = Image.new('L', size, BACKGROUND)
         draw = ImageDraw.Draw(img)
         
         center_x, center_y = size[0] // 2, size[1] // 2
@@ -31,40 +35,27 @@ def create_sample_anime_faces():
             (center_x + 50, center_y - 40),
             (center_x - 50, center_y - 40)
         ]
-        draw.polygon(hair_points, fill=hair_color)
+        draw.polygon(hair_points, fill=HAIR)
         
         # 顔（楕円）
         face_bbox = [center_x - 50, center_y - 40, center_x + 50, center_y + 60]
-        draw.ellipse(face_bbox, fill=face_color, outline=(200, 180, 140), width=2)
+        draw.ellipse(face_bbox, fill=FACE, outline=FACE_OUTLINE, width=2)
         
-        # 目
-        # 左目
-        left_eye_center = (center_x - 20, center_y - 10)
-        draw.ellipse([left_eye_center[0] - 12, left_eye_center[1] - 8,
-                     left_eye_center[0] + 12, left_eye_center[1] + 8], 
-                    fill=(255, 255, 255), outline=(0, 0, 0), width=2)
-        draw.ellipse([left_eye_center[0] - 6, left_eye_center[1] - 4,
-                     left_eye_center[0] + 6, left_eye_center[1] + 4], 
-                    fill=eye_color)
-        draw.ellipse([left_eye_center[0] - 2, left_eye_center[1] - 2,
-                     left_eye_center[0] + 2, left_eye_center[1] + 2], 
-                    fill=(0, 0, 0))
-        
-        # 右目
-        right_eye_center = (center_x + 20, center_y - 10)
-        draw.ellipse([right_eye_center[0] - 12, right_eye_center[1] - 8,
-                     right_eye_center[0] + 12, right_eye_center[1] + 8], 
-                    fill=(255, 255, 255), outline=(0, 0, 0), width=2)
-        draw.ellipse([right_eye_center[0] - 6, right_eye_center[1] - 4,
-                     right_eye_center[0] + 6, right_eye_center[1] + 4], 
-                    fill=eye_color)
-        draw.ellipse([right_eye_center[0] - 2, right_eye_center[1] - 2,
-                     right_eye_center[0] + 2, right_eye_center[1] + 2], 
-                    fill=(0, 0, 0))
+        # 目（左目・右目）
+        for eye_center in [(center_x - 20, center_y - 10), (center_x + 20, center_y - 10)]:
+            draw.ellipse([eye_center[0] - 12, eye_center[1] - 8,
+                         eye_center[0] + 12, eye_center[1] + 8], 
+                        fill=EYE_WHITE, outline=EYE_OUTLINE, width=2)
+            draw.ellipse([eye_center[0] - 6, eye_center[1] - 4,
+                         eye_center[0] + 6, eye_center[1] + 4], 
+                        fill=IRIS)
+            draw.ellipse([eye_center[0] - 2, eye_center[1] - 2,
+                         eye_center[0] + 2, eye_center[1] + 2], 
+                        fill=PUPIL)
         
         # 鼻（小さな点）
         draw.ellipse([center_x - 2, center_y + 5, center_x + 2, center_y + 9], 
-                    fill=(200, 150, 120))
+                    fill=NOSE)
         
         # 口
         mouth_points = [
@@ -72,9 +63,27 @@ def create_sample_anime_faces():
             (center_x, center_y + 30),
             (center_x + 10, center_y + 25)
         ]
-        draw.polygon(mouth_points, fill=(200, 100, 100))
+        draw.polygon(mouth_points, fill=MOUTH)
         
-        return img
+        return np.array(img)
+    
+    def create_anime_face(labels, face_color=(255, 220, 177), 
+                         hair_color=(139, 69, 19), eye_color=(0, 100, 200)):
+        """ラベルマップに色を割り当ててアニメ風顔を作成（BGR形式）"""
+        palette = np.zeros((MOUTH + 1, 3), dtype=np.uint8)
+        palette[BACKGROUND] = (255, 255, 255)
+        palette[HAIR] = hair_color
+        palette[FACE] = face_color
+        palette[FACE_OUTLINE] = (200, 180, 140)
+        palette[EYE_WHITE] = (255, 255, 255)
+        palette[EYE_OUTLINE] = (0, 0, 0)
+        palette[IRIS] = eye_color
+        palette[PUPIL] = (0, 0, 0)
+        palette[NOSE] = (200, 150, 120)
+        palette[MOUTH] = (200, 100, 100)
+        
+        # RGBの色をBGRに並べ替えて各画素に割り当て
+        return palette[:, ::-1][labels]
     
     # 異なる特徴を持つ複数のサンプル顔を作成
     samples = [
@@ -112,15 +121,18 @@ def create_sample_anime_faces():
     
     print("サンプルアニメ画像を作成中...")
     
+    labels = create_face_labels()
+    
     for sample in samples:
         img = create_anime_face(
+            labels,
             face_color=sample["face_color"],
             hair_color=sample["hair_color"], 
             eye_color=sample["eye_color"]
         )
         
         filepath = os.path.join(input_dir, sample["filename"])
-        img.save(filepath)
+        cv2.imwrite(filepath, img)
         print(f"作成完了: {filepath}")
     
     print(f"\n{len(samples)}個のサンプル画像を作成しました。")
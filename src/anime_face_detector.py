@@ -1,15 +1,23 @@
 import cv2
 import numpy as np
 import os
+import shutil
 import requests
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Union
 
 class AnimeFaceDetector:
     """アニメ顔検出用のクラス"""
     
-    def __init__(self, model_path: str = "models/lbpcascade_animeface.xml"):
+    def __init__(self, model_path: str = "models/lbpcascade_animeface.xml",
+                 num_threads: Optional[int] = None, use_opencl: bool = True):
         self.model_path = model_path
         self.cascade = None
+        # OpenCLが使える場合にUMat経由で検出するか（失敗した時点で以降は無効化）
+        self.use_opencl = use_opencl
+        # detectMultiScale内部の並列処理に使うスレッド数
+        # （未指定ならcgroupやアフィニティを考慮したOpenCVの既定値のまま）
+        if num_threads is not None:
+            cv2.setNumThreads(num_threads)
         self._download_model_if_needed()
         self._load_model()
     
@@ -21,14 +29,27 @@ class AnimeFaceDetector:
             
             # lbpcascade_animeface.xmlをダウンロード
             url = "https://raw.githubusercontent.com/nagadomi/lbpcascade_animeface/master/lbpcascade_animeface.xml"
-            response = requests.get(url)
+            # 全体をメモリに載せず、受信しながら一時ファイルに書き込む
+            temp_path = self.model_path + ".part"
+            try:
+                # 応答が止まった場合に起動が止まり続けないよう、接続・受信にタイムアウトを設定
+                with requests.get(url, stream=True, timeout=30) as response:
+                    if response.status_code != 200:
+                        raise Exception(f"モデルのダウンロードに失敗しました: {response.status_code}")
+                    
+                    # 圧縮転送された場合も展開して書き込む
+                    response.raw.decode_content = True
+                    with open(temp_path, 'wb') as f:
+                        shutil.copyfileobj(response.raw, f)
+            except BaseException:
+                # 失敗した場合は書きかけの一時ファイルを削除
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
             
-            if response.status_code == 200:
-                with open(self.model_path, 'wb') as f:
-                    f.write(response.content)
-                print(f"モデルを保存しました: {self.model_path}")
-            else:
-                raise Exception(f"モデルのダウンロードに失敗しました: {response.status_code}")
+            # 書き込み完了後に置き換え、途中で失敗しても不完全なモデルが残らないようにする
+            os.replace(temp_path, self.model_path)
+            print(f"モデルを保存しました: {self.model_path}")
     
     def _load_model(self):
         """モデルを読み込み"""
@@ -44,7 +65,7 @@ class AnimeFaceDetector:
         画像からアニメ顔を検出
         
         Args:
-            image: 入力画像 (BGR形式)
+            image: 入力画像 (BGR形式、またはグレースケール)
             
         Returns:
             検出された顔の座標リスト [(x, y, w, h), ...]
@@ -52,21 +73,50 @@ class AnimeFaceDetector:
         if self.cascade is None:
             raise Exception("モデルが読み込まれていません")
         
-        # グレースケールに変換
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # グレースケールに変換（グレースケール画像はそのまま使用）
+        if len(image.shape) == 3:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        else:
+            gray = image
         
-        # 顔検出
-        faces = self.cascade.detectMultiScale(
+        # 顔検出（OpenCLが使える場合はUMat経由でGPU/iGPUに任せ、失敗したらCPUで検出）
+        faces = None
+        if self.use_opencl and cv2.ocl.useOpenCL():
+            try:
+                faces = self._detect_multiscale(cv2.UMat(gray))
+            except cv2.error:
+                # 毎回例外と転送のコストを払わないよう、以降はCPUのみで検出
+                self.use_opencl = False
+                faces = None
+        if faces is None:
+            faces = self._detect_multiscale(gray)
+        
+        # 検出されなかった場合は空のタプルが返る
+        if len(faces) == 0:
+            return []
+        
+        return faces.tolist()
+    
+    def _detect_multiscale(self, gray: Union[np.ndarray, cv2.UMat]) -> np.ndarray:
+        """
+        カスケード分類器で顔を検出
+        
+        Args:
+            gray: グレースケール画像 (np.ndarray または cv2.UMat)
+            
+        Returns:
+            検出された顔の座標 (N, 4)
+        """
+        return self.cascade.detectMultiScale(
             gray,
             scaleFactor=1.1,
             minNeighbors=5,
             minSize=(24, 24)
         )
-        
-        return faces.tolist()
     
     def extract_face(self, image: np.ndarray, face_coords: Tuple[int, int, int, int], 
-                    target_size: Tuple[int, int] = (128, 128)) -> np.ndarray:
+                    target_size: Tuple[int, int] = (128, 128),
+                    interpolation: Optional[int] = None) -> np.ndarray:
         """
         画像から顔部分を切り抜いてリサイズ
         
@@ -74,6 +124,8 @@ class AnimeFaceDetector:
             image: 入力画像
             face_coords: 顔の座標 (x, y, w, h)
             target_size: 出力サイズ (width, height)
+            interpolation: リサイズの補間方法。Noneの場合、縮小時はINTER_AREA、
+                拡大時はINTER_LINEARを使用（画質優先ならcv2.INTER_LANCZOS4を指定）
             
         Returns:
             切り抜かれた顔画像
@@ -83,8 +135,15 @@ class AnimeFaceDetector:
         # 顔部分を切り抜き
         face_image = image[y:y+h, x:x+w]
         
+        # 縮小か拡大かで補間方法を選択
+        if interpolation is None:
+            if w > target_size[0] or h > target_size[1]:
+                interpolation = cv2.INTER_AREA
+            else:
+                interpolation = cv2.INTER_LINEAR
+        
         # 指定サイズにリサイズ
-        resized_face = cv2.resize(face_image, target_size, interpolation=cv2.INTER_LANCZOS4)
+        resized_face = cv2.resize(face_image, target_size, interpolation=interpolation)
         
         return resized_face
     
@@ -99,14 +158,36 @@ class AnimeFaceDetector:
         Returns:
             抽出された顔画像のリスト
         """
-        # 画像を読み込み
+        # 検出用にグレースケールで読み込み
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise Exception(f"画像の読み込みに失敗しました: {image_path}")
+        
+        # 顔検出
+        faces = self.detect_faces(gray)
+        if not faces:
+            return []
+        
+        # 顔が見つかった場合のみカラーで読み込み
         image = cv2.imread(image_path)
         if image is None:
             raise Exception(f"画像の読み込みに失敗しました: {image_path}")
         
-        # 顔検出
-        faces = self.detect_faces(image)
+        return self._crop_faces(image, faces, target_size)
+    
+    def _crop_faces(self, image: np.ndarray, faces: List[Tuple[int, int, int, int]],
+                    target_size: Tuple[int, int]) -> List[np.ndarray]:
+        """
+        検出済みの顔を画像から切り抜く
         
+        Args:
+            image: 入力画像 (BGR形式)
+            faces: 顔の座標リスト [(x, y, w, h), ...]
+            target_size: 出力サイズ
+            
+        Returns:
+            抽出された顔画像のリスト
+        """
         # 顔を切り抜き
         extracted_faces = []
         for face_coords in faces:
@@ -1,145 +1,234 @@
 import cv2
 import numpy as np
-from typing import List, Tuple
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
+from typing import List, Optional, Tuple, Union
 import matplotlib.pyplot as plt
 import os
+from concurrent.futures import ThreadPoolExecutor
+
+from lbp_kernel import lbp_8_1
 
 class FaceAnalyzer:
     """顔画像の平均顔作成と類似度測定を行うクラス"""
     
-    def __init__(self):
-        self.scaler = StandardScaler()
-    
-    def create_average_face(self, face_images: List[np.ndarray]) -> np.ndarray:
+    def create_average_face(self, face_images: Union[List[np.ndarray], np.ndarray]) -> np.ndarray:
         """
         複数の顔画像から平均顔を作成
         
         Args:
-            face_images: 顔画像のリスト
+            face_images: 顔画像のリスト、または同じサイズの顔画像を格納した配列 (N, H, W, 3)
+                （uint8以外の画像も受け付けるが、uint8の場合のみ整数演算で高速に処理）
             
         Returns:
-            平均顔画像
+            平均顔画像 (uint8)
         """
-        if not face_images:
+        if len(face_images) == 0:
             raise ValueError("顔画像が提供されていません")
         
+        # uint8の画像はint32で累積し、それ以外（浮動小数点など）はfloat64で累積
+        if isinstance(face_images, np.ndarray):
+            is_uint8 = face_images.dtype == np.uint8
+        else:
+            is_uint8 = all(face.dtype == np.uint8 for face in face_images)
+        accumulator_dtype = np.int32 if is_uint8 else np.float64
+        
+        # 連続した配列の場合は先頭から順に一度で合計
+        if isinstance(face_images, np.ndarray):
+            accumulator = face_images.sum(axis=0, dtype=accumulator_dtype)
+            return self._mean_to_uint8(accumulator, len(face_images))
+        
         # 全ての画像を同じサイズに統一（既にリサイズ済みの前提）
         height, width = face_images[0].shape[:2]
         
-        # 画像を浮動小数点型に変換
-        face_arrays = []
+        # 1つのバッファに画素値を累積
+        accumulator = np.zeros(face_images[0].shape, dtype=accumulator_dtype)
         for face in face_images:
             if face.shape[:2] != (height, width):
                 face = cv2.resize(face, (width, height))
-            face_arrays.append(face.astype(np.float64))
+            accumulator += face
         
-        # 平均を計算
-        average_face = np.mean(face_arrays, axis=0)
+        return self._mean_to_uint8(accumulator, len(face_images))
+    
+    def _mean_to_uint8(self, accumulator: np.ndarray, count: int) -> np.ndarray:
+        """
+        累積した画素値から平均を計算してuint8に変換
         
-        # uint8に変換して返す
-        return np.clip(average_face, 0, 255).astype(np.uint8)
+        Args:
+            accumulator: 画素値の合計
+            count: 画像の枚数
+            
+        Returns:
+            平均画像 (uint8)
+        """
+        if accumulator.dtype == np.int32:
+            return (accumulator // count).astype(np.uint8)
+        return np.clip(accumulator / count, 0, 255).astype(np.uint8)
     
     def extract_features(self, image: np.ndarray) -> np.ndarray:
         """
         画像から特徴量を抽出
         
         Args:
-            image: 入力画像
+            image: 入力画像 (uint8)
             
         Returns:
-            特徴量ベクトル
+            特徴量ベクトル (float32)
         """
+        return self.extract_features_batch([image])[0]
+    
+    def extract_features_batch(self, face_images: List[np.ndarray]) -> np.ndarray:
+        """
+        複数の顔画像の特徴量を (N, D) の行列にまとめて抽出
+        
+        同じサイズの画像は縦に連結した1枚の画像として扱い、
+        グレースケール変換と勾配計算を画像ごとではなく一度に実行する
+        
+        Args:
+            face_images: 顔画像のリスト (uint8)
+            
+        Returns:
+            特徴量行列 (float32)
+        """
+        # 画像がない場合は空の特徴量行列（輝度256 + LBP256 + HOG9 次元）
+        if len(face_images) == 0:
+            return np.empty((0, 256 + 256 + 9), dtype=np.float32)
+        
+        # ヒストグラムは256ビン固定のため、uint8以外の画像は受け付けない
+        for face in face_images:
+            if face.dtype != np.uint8:
+                raise ValueError(f"顔画像はuint8である必要があります: {face.dtype}")
+        
+        # サイズが揃っていない場合は1枚ずつ処理
+        if len({face.shape for face in face_images}) > 1:
+            return np.concatenate([self.extract_features_batch([face]) for face in face_images])
+        
+        faces = np.asarray(face_images)
+        n_faces, height, width = faces.shape[:3]
+        
+        # 各画像の上下に1行ずつ反射パディングを入れて縦に連結
+        # （Sobelの境界処理 BORDER_REFLECT_101 と同じ値になり、隣の画像の画素を参照しない）
+        padding = ((0, 0), (1, 1)) + ((0, 0),) * (faces.ndim - 2)
+        stacked = np.pad(faces, padding, mode='reflect')
+        stacked = stacked.reshape((n_faces * (height + 2), width) + faces.shape[3:])
+        
         # グレースケールに変換
-        if len(image.shape) == 3:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if len(stacked.shape) == 3:
+            stacked_gray = cv2.cvtColor(stacked, cv2.COLOR_BGR2GRAY)
         else:
-            gray = image
+            stacked_gray = stacked
+        gray = stacked_gray.reshape(n_faces, height + 2, width)[:, 1:-1]
         
         # ヒストグラム特徴量
-        hist = cv2.calcHist([gray], [0], None, [256], [0, 256])
-        hist = hist.flatten() / hist.sum()  # 正規化
+        hist = self._normalized_histograms(gray)
         
         # LBP (Local Binary Pattern) 特徴量
-        lbp = self._calculate_lbp(gray)
-        lbp_hist = cv2.calcHist([lbp], [0], None, [256], [0, 256])
-        lbp_hist = lbp_hist.flatten() / lbp_hist.sum()  # 正規化
+        lbp = np.empty((n_faces, height, width), dtype=np.uint8)
+        for i in range(n_faces):
+            lbp[i] = self._calculate_lbp(gray[i])
+        lbp_hist = self._normalized_histograms(lbp)
         
         # HOG特徴量（簡易版）
-        hog_features = self._calculate_simple_hog(gray)
+        hog_features = self._calculate_simple_hog(stacked_gray, n_faces)
         
         # 特徴量を結合
-        features = np.concatenate([hist, lbp_hist, hog_features])
+        return np.hstack([hist, lbp_hist, hog_features])
+    
+    def _normalized_histograms(self, images: np.ndarray) -> np.ndarray:
+        """
+        uint8画像ごとの256ビンヒストグラムを合計1に正規化して計算
+        
+        Args:
+            images: uint8画像の配列 (N, H, W)
+            
+        Returns:
+            正規化されたヒストグラム (N, 256) (float32)
+        """
+        n_images = len(images)
         
-        return features
+        # 画像ごとにビン番号をずらし、1回のbincountでまとめて集計
+        offsets = np.arange(n_images)[:, None] * 256
+        hist = np.bincount((images.reshape(n_images, -1) + offsets).ravel(), minlength=256 * n_images)
+        hist = hist.reshape(n_images, 256).astype(np.float32)
+        hist *= 1.0 / (hist.sum(axis=1, keepdims=True) + 1e-9)
+        return hist
     
     def _calculate_lbp(self, image: np.ndarray, radius: int = 1, n_points: int = 8) -> np.ndarray:
         """
         Local Binary Pattern を計算
         
         Args:
-            image: グレースケール画像
+            image: グレースケール画像 (uint8)
             radius: 半径
             n_points: サンプリング点数
             
         Returns:
             LBP画像
         """
+        # 既定のパラメータでは特殊化したカーネルを使用
+        if radius == 1 and n_points == 8:
+            return lbp_8_1(image)
+        
         height, width = image.shape
         lbp = np.zeros((height, width), dtype=np.uint8)
         
-        for i in range(radius, height - radius):
-            for j in range(radius, width - radius):
-                center = image[i, j]
-                binary_string = ""
-                
-                for k in range(n_points):
-                    angle = 2 * np.pi * k / n_points
-                    x = int(i + radius * np.cos(angle))
-                    y = int(j + radius * np.sin(angle))
-                    
-                    if x >= 0 and x < height and y >= 0 and y < width:
-                        if image[x, y] >= center:
-                            binary_string += "1"
-                        else:
-                            binary_string += "0"
-                    else:
-                        binary_string += "0"
-                
-                lbp[i, j] = int(binary_string, 2)
+        # 近傍画素のオフセットを事前計算
+        angles = 2 * np.pi * np.arange(n_points) / n_points
+        dx = np.round(radius * np.cos(angles)).astype(int)
+        dy = np.round(radius * np.sin(angles)).astype(int)
+        
+        # 中心画素（境界は0のまま）
+        center = image[radius:height - radius, radius:width - radius]
+        
+        # 近傍ごとにシフトしたスライスと比較してビットプレーンを作成
+        bit_planes = [
+            image[radius + dx[k]:height - radius + dx[k],
+                  radius + dy[k]:width - radius + dy[k]] >= center
+            for k in range(n_points)
+        ]
+        
+        # 先頭の近傍が最上位ビットになるよう逆順に並べ、1回のpackbitsでLBPコードに変換
+        bits = np.stack(bit_planes[::-1], axis=-1)
+        codes = np.packbits(bits, axis=-1, bitorder='little')[..., 0]
+        lbp[radius:height - radius, radius:width - radius] = codes
         
         return lbp
     
-    def _calculate_simple_hog(self, image: np.ndarray) -> np.ndarray:
+    def _calculate_simple_hog(self, stacked_image: np.ndarray, n_images: int) -> np.ndarray:
         """
         簡易HOG特徴量を計算
         
         Args:
-            image: グレースケール画像
+            stacked_image: 上下に1行ずつパディングした画像を縦に連結したグレースケール画像
+            n_images: 連結されている画像の枚数
             
         Returns:
-            HOG特徴量
+            画像ごとのHOG特徴量 (N, 9) (float32)
         """
-        # Sobelフィルタで勾配を計算
-        grad_x = cv2.Sobel(image, cv2.CV_64F, 1, 0, ksize=3)
-        grad_y = cv2.Sobel(image, cv2.CV_64F, 0, 1, ksize=3)
+        # Sobelフィルタで勾配を計算（int16で帯域を抑える）
+        grad_x = cv2.Sobel(stacked_image, cv2.CV_16S, 1, 0, ksize=3)
+        grad_y = cv2.Sobel(stacked_image, cv2.CV_16S, 0, 1, ksize=3)
+        
+        # 勾配の大きさと方向を計算（角度は度単位）
+        magnitude, angle = cv2.cartToPolar(grad_x.astype(np.float32), grad_y.astype(np.float32),
+                                           angleInDegrees=True)
         
-        # 勾配の大きさと方向を計算
-        magnitude = np.sqrt(grad_x**2 + grad_y**2)
-        angle = np.arctan2(grad_y, grad_x)
+        # パディング行を除いて画像ごとに分割
+        padded_height = stacked_image.shape[0] // n_images
+        magnitude = magnitude.reshape(n_images, padded_height, -1)[:, 1:-1]
+        angle = angle.reshape(n_images, padded_height, -1)[:, 1:-1]
         
-        # 角度を0-180度に正規化
-        angle = np.degrees(angle) % 180
+        # 角度を0-180度に正規化して9つのビンに割り当て（画像ごとにビン番号をずらす）
+        bin_idx = np.minimum((angle % 180) // 20, 8).astype(np.intp)
+        bin_idx += np.arange(n_images)[:, None, None] * 9
         
-        # ヒストグラムを作成（9つのビン）
-        hist, _ = np.histogram(angle, bins=9, range=(0, 180), weights=magnitude)
+        # 勾配の大きさで重み付けしたヒストグラムを作成
+        hist = np.bincount(bin_idx.ravel(), weights=magnitude.ravel(), minlength=9 * n_images)
+        hist = hist.reshape(n_images, 9)
         
         # 正規化
-        if hist.sum() > 0:
-            hist = hist / hist.sum()
+        totals = hist.sum(axis=1, keepdims=True)
+        hist = np.divide(hist, totals, out=np.zeros_like(hist), where=totals > 0)
         
-        return hist
+        return hist.astype(np.float32)
     
     def calculate_similarity(self, image1: np.ndarray, image2: np.ndarray) -> float:
         """
@@ -157,29 +246,43 @@ class FaceAnalyzer:
         features2 = self.extract_features(image2)
         
         # コサイン類似度を計算
-        similarity = cosine_similarity([features1], [features2])[0][0]
+        similarity = float(np.dot(features1, features2) /
+                           (np.linalg.norm(features1) * np.linalg.norm(features2) + 1e-9))
         
         # 0-1の範囲に正規化
         return (similarity + 1) / 2
     
     def calculate_similarities_to_average(self, face_images: List[np.ndarray], 
-                                        average_face: np.ndarray) -> List[float]:
+                                        average_face: np.ndarray,
+                                        features: Optional[np.ndarray] = None) -> List[float]:
         """
         各顔画像と平均顔の類似度を計算
         
         Args:
             face_images: 顔画像のリスト
             average_face: 平均顔画像
+            features: 事前に抽出済みの各顔画像の特徴量行列 (N, D)。Noneの場合はここで抽出
             
         Returns:
             類似度のリスト
         """
-        similarities = []
-        for face in face_images:
-            similarity = self.calculate_similarity(face, average_face)
-            similarities.append(similarity)
+        if len(face_images) == 0:
+            return []
+        
+        # 全ての顔の特徴量を行列にまとめ、平均顔の特徴量は一度だけ抽出
+        if features is None:
+            features = self.extract_features_batch(face_images)
+        else:
+            features = features.astype(np.float32)
+        average_features = self.extract_features(average_face)
         
-        return similarities
+        # L2正規化して1回の行列ベクトル積でコサイン類似度を計算
+        features /= np.linalg.norm(features, axis=1, keepdims=True) + 1e-9
+        average_features /= np.linalg.norm(average_features) + 1e-9
+        similarities = features @ average_features
+        
+        # 0-1の範囲に正規化
+        return ((similarities + 1) / 2).tolist()
     
     def save_results(self, average_face: np.ndarray, face_images: List[np.ndarray], 
                     similarities: List[float], output_dir: str):
@@ -194,13 +297,25 @@ class FaceAnalyzer:
         """
         os.makedirs(output_dir, exist_ok=True)
         
-        # 平均顔を保存
-        cv2.imwrite(os.path.join(output_dir, "average_face.jpg"), average_face)
-        
-        # 個別の顔画像を保存（類似度付き）
-        for i, (face, similarity) in enumerate(zip(face_images, similarities)):
-            filename = f"face_{i:03d}_similarity_{similarity:.3f}.jpg"
-            cv2.imwrite(os.path.join(output_dir, filename), face)
+        # JPEGエンコード中はGILが解放されるため、スレッドプールで並列に書き出す
+        jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, 90]
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            futures = []
+            
+            # 平均顔を保存
+            path = os.path.join(output_dir, "average_face.jpg")
+            futures.append((path, executor.submit(cv2.imwrite, path, average_face, jpeg_params)))
+            
+            # 個別の顔画像を保存（類似度付き）
+            for i, (face, similarity) in enumerate(zip(face_images, similarities)):
+                filename = f"face_{i:03d}_similarity_{similarity:.3f}.jpg"
+                path = os.path.join(output_dir, filename)
+                futures.append((path, executor.submit(cv2.imwrite, path, face, jpeg_params)))
+            
+            # cv2.imwriteは失敗時に例外ではなくFalseを返すため、戻り値を確認する
+            for path, future in futures:
+                if not future.result():
+                    raise IOError(f"画像の保存に失敗しました: {path}")
         
         # 類似度の統計情報を保存
         stats = {
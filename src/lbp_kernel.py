@@ -0,0 +1,35 @@
+import numpy as np
+from numba import njit
+
+@njit(cache=True)
+def lbp_8_1(image):
+    """
+    半径1・8近傍のLBPを計算（FaceAnalyzer._calculate_lbp の特殊化版）
+
+    近傍の順序とビットの割り当ては汎用版と同じで、
+    先頭の近傍 (1, 0) が最上位ビットになる。境界画素は0のまま。
+
+    Args:
+        image: グレースケール画像
+
+    Returns:
+        LBP画像
+    """
+    height, width = image.shape
+    lbp = np.zeros((height, width), dtype=np.uint8)
+
+    for i in range(1, height - 1):
+        for j in range(1, width - 1):
+            center = image[i, j]
+            code = 0
+            code |= (image[i + 1, j] >= center) << 7
+            code |= (image[i + 1, j + 1] >= center) << 6
+            code |= (image[i, j + 1] >= center) << 5
+            code |= (image[i - 1, j + 1] >= center) << 4
+            code |= (image[i - 1, j] >= center) << 3
+            code |= (image[i - 1, j - 1] >= center) << 2
+            code |= (image[i, j - 1] >= center) << 1
+            code |= (image[i + 1, j - 1] >= center)
+            lbp[i, j] = code
+
+    return lbp
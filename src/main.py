@@ -11,7 +11,8 @@
 import os
 import sys
 import glob
-from typing import List
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
 import cv2
 import numpy as np
 from tqdm import tqdm
@@ -22,6 +23,56 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from anime_face_detector import AnimeFaceDetector
 from face_analyzer import FaceAnalyzer
 
+# ワーカープロセスごとに保持するアニメ顔検出器と顔解析器
+_worker_detector = None
+_worker_analyzer = None
+
+def _init_worker(model_path: str):
+    """ワーカープロセスを初期化（カスケードはプロセスごとに一度だけ読み込む）"""
+    global _worker_detector, _worker_analyzer
+    # プロセス単位で並列化しているため、OpenCV内部のスレッドは1本に抑える
+    # また、全ワーカーが同じGPUにOpenCLコンテキストを作らないようCPUで検出する
+    _worker_detector = AnimeFaceDetector(model_path, num_threads=1, use_opencl=False)
+    _worker_analyzer = FaceAnalyzer()
+
+def _detect_worker(image_file: str, target_size: Tuple[int, int]) -> Tuple[List[np.ndarray], Optional[np.ndarray]]:
+    """ワーカープロセスで画像から顔を抽出し、切り抜いた直後に特徴量も計算"""
+    faces = _worker_detector.process_image(image_file, target_size)
+    if not faces:
+        return faces, None
+    return faces, _worker_analyzer.extract_features_batch(faces)
+
+def extract_faces_parallel(image_files: List[str], model_path: str,
+                           target_size: Tuple[int, int]) -> Dict[int, Tuple[List[np.ndarray], Optional[np.ndarray]]]:
+    """
+    プロセスプールで並列に顔と特徴量を抽出
+    
+    各ワーカーが自分で画像を読み込むため、読み込み待ちの間も他のワーカーが検出を進める
+    
+    Args:
+        image_files: 画像ファイルのパスのリスト
+        model_path: アニメ顔検出モデルのパス
+        target_size: 顔画像の出力サイズ
+        
+    Returns:
+        画像のインデックスをキーとした (抽出顔画像のリスト, 特徴量行列) のタプル
+    """
+    results = {}
+    with ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=_init_worker,
+                             initargs=(model_path,)) as executor:
+        futures = {
+            executor.submit(_detect_worker, image_file, target_size): idx
+            for idx, image_file in enumerate(image_files)
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="顔抽出"):
+            idx = futures[future]
+            try:
+                results[idx] = future.result()
+            except Exception as e:
+                print(f"警告: {image_files[idx]}の処理中にエラーが発生しました: {e}")
+    
+    return results
+
 def main():
     """メイン処理"""
     print("=" * 50)
@@ -72,25 +123,34 @@ def main():
     
     # 全ての画像から顔を抽出
     print("\n2. 画像から顔を抽出中...")
-    all_faces = []
     face_info = []  # (画像ファイル名, 顔のインデックス) の情報
-    
-    for image_file in tqdm(image_files, desc="顔抽出"):
-        try:
-            faces = detector.process_image(image_file, target_size)
-            for i, face in enumerate(faces):
-                all_faces.append(face)
-                face_info.append((os.path.basename(image_file), i))
-        except Exception as e:
-            print(f"警告: {image_file}の処理中にエラーが発生しました: {e}")
-            continue
-    
-    if not all_faces:
+    feature_blocks = []  # 画像ごとの特徴量行列
+    
+    # 各画像は独立しているため、プロセスプールで並列に処理
+    results = extract_faces_parallel(image_files, detector.model_path, target_size)
+    
+    # 顔の総数を数えてから、全ての顔を1つの連続した配列に格納
+    total_faces = sum(len(faces) for faces, _ in results.values())
+    all_faces = np.empty((total_faces, target_size[1], target_size[0], 3), dtype=np.uint8)
+    
+    # 完了順ではなく入力順に顔を並べる
+    face_count = 0
+    for idx, image_file in enumerate(image_files):
+        faces, features = results.pop(idx, ([], None))
+        for i, face in enumerate(faces):
+            all_faces[face_count] = face
+            face_count += 1
+            face_info.append((os.path.basename(image_file), i))
+        if features is not None:
+            feature_blocks.append(features)
+    
+    if total_faces == 0:
         print("エラー: 顔が検出されませんでした")
         print("入力画像にアニメキャラクターの顔が含まれているか確認してください")
         return
     
     print(f"✓ 合計 {len(all_faces)} 個の顔を抽出しました")
+    all_features = np.concatenate(feature_blocks)
     
     # 平均顔を作成
     print("\n3. 平均顔を作成中...")
@@ -104,7 +164,8 @@ def main():
     # 類似度を計算
     print("\n4. 類似度を計算中...")
     try:
-        similarities = analyzer.calculate_similarities_to_average(all_faces, average_face)
+        # 顔の特徴量は抽出時に計算済みのため、平均顔の特徴量のみ新たに計算
+        similarities = analyzer.calculate_similarities_to_average(all_faces, average_face, all_features)
         print("✓ 類似度計算完了")
     except Exception as e:
         print(f"エラー: 類似度計算に失敗しました: {e}")